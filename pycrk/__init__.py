@@ -1,17 +1,24 @@
 #!/usr/bin/env python
 
 import logging
+import mmap
 import os
 import os.path
 import re
-from typing import Generator, Iterable, Iterator, List, Sequence
+import string
+from concurrent.futures import ProcessPoolExecutor
+from typing import Generator, Iterable, Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
 
 
 __log__ = logging.getLogger(__name__)
 
-CHANGE_RE = re.compile(r"^([0-9a-f]+)\s*:\s*([0-9a-f]{2})\s+([0-9a-f]{2})$", re.I)
+HEX_DIGITS = frozenset(string.hexdigits)
+
+CHANGE_RE = re.compile(r"^([0-9a-f]+)\s*:\s*([0-9a-f]{2})\s+([0-9a-f]{2})$", re.I | re.M)
 
-READ_BUFFER = 1024 * 4  # Read files in 4KB chunks
+READ_BUFFER = 1024 * 64  # Read files in 64KB chunks
 
 
 class InvalidFormat(ValueError):
@@ -21,77 +28,168 @@ class InvalidFormat(ValueError):
 class Change:
     """A single byte change to a file"""
 
-    def __init__(self, offset: int, orig: bytes, patch: bytes):
+    __slots__ = ("offset", "orig", "patch")
+
+    def __init__(self, offset: int, orig: int, patch: int):
         self.offset = offset
         self.orig = orig
         self.patch = patch
 
     def valid(self, fp) -> bool:
         """Check if this change is valid for the file"""
-        fp.seek(self.offset)
-        return fp.read(1) in (self.orig, self.patch)
+        b = _read_at(fp, self.offset, 1)
+        return len(b) == 1 and b[0] in (self.orig, self.patch)
 
     def applied(self, fp) -> bool:
         """Checks if the change has been applied to the file"""
-        fp.seek(self.offset)
-        return fp.read(1) == self.patch
+        b = _read_at(fp, self.offset, 1)
+        return len(b) == 1 and b[0] == self.patch
 
     def apply(self, fp, unpatch=False) -> bool:
         """Applies the change to the file"""
-        fp.seek(self.offset)
-        return fp.write(self.orig if unpatch else self.patch) == 1
+        return _write_at(fp, self.offset, bytes((self.orig if unpatch else self.patch,))) == 1
 
     @classmethod
     def parse(cls, s) -> "Change":
-        if not (m := CHANGE_RE.fullmatch(s)):
-            raise InvalidFormat(f"'{s}' is not a valid change")
-        return cls(
-            offset=int(m[1], 16),
-            orig=bytes.fromhex(m[2]),
-            patch=bytes.fromhex(m[3])
-        )
+        # Pull the line apart manually - much faster than a regex
+        try:
+            offset, _, rest = s.partition(":")
+            offset = offset.strip()
+            orig, patch = rest.split()
+            if not offset or not HEX_DIGITS.issuperset(offset) \
+                    or len(orig) != 2 or len(patch) != 2 \
+                    or not HEX_DIGITS.issuperset(orig + patch):
+                raise ValueError("Invalid change format")
+            return cls(
+                offset=int(offset, 16),
+                orig=int(orig, 16),
+                patch=int(patch, 16)
+            )
+        except ValueError as e:
+            raise InvalidFormat(f"'{s}' is not a valid change") from e
 
     def __repr__(self) -> str:
-        return "{}(offset={:08X}, orig={:02X}, patch={:02X})".format(
-            self.__class__.__name__,
-            self.offset,
-            self.orig[0],
-            self.patch[0]
+        return (
+            f"{self.__class__.__name__}(offset={self.offset:08X}, "
+            f"orig={self.orig:02X}, patch={self.patch:02X})"
         )
 
     def serialize(self) -> str:
         """The change as it would appear in a crk file"""
-        return "{:08X}: {:02X} {:02X}".format(
-            self.offset,
-            self.orig[0],
-            self.patch[0]
+        return f"{self.offset:08X}: {self.orig:02X} {self.patch:02X}"
+
+
+class ChangeSet:
+    """A set of byte changes stored as parallel offset/orig/patch arrays
+
+    Storing the raw data in arrays instead of per-change objects keeps
+    memory usage low and enables vectorized operations on the entire set.
+    """
+
+    __slots__ = ("offsets", "orig", "patch")
+
+    def __init__(self, offsets, orig, patch):
+        offsets = np.asarray(offsets, dtype=np.int64)
+
+        # Keep everything sorted by offset so downstream access is always
+        # a single forward sweep over the file
+        order = np.argsort(offsets)
+        offsets = offsets[order]
+        if np.any(offsets[1:] == offsets[:-1]):
+            raise ValueError("Duplicate change offsets")
+
+        self.offsets = offsets
+        self.orig = np.asarray(orig, dtype=np.uint8)[order]
+        self.patch = np.asarray(patch, dtype=np.uint8)[order]
+
+    @classmethod
+    def from_changes(cls, changes: Iterable[Change]) -> "ChangeSet":
+        changes = list(changes)
+        return cls(
+            offsets=[c.offset for c in changes],
+            orig=[c.orig for c in changes],
+            patch=[c.patch for c in changes]
         )
 
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> Change:
+        return Change(
+            offset=int(self.offsets[i]),
+            orig=int(self.orig[i]),
+            patch=int(self.patch[i])
+        )
+
+    def __iter__(self) -> Iterator[Change]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def runs(self) -> List[Tuple[int, bytes, bytes]]:
+        """Coalesce changes at consecutive offsets into (offset, orig, patch) runs
+
+        Lets the set be checked/applied with a single read/write per run
+        instead of one per byte.
+        """
+        if not len(self):
+            return []
+
+        # Split wherever an offset isn't consecutive with the previous one
+        splits = np.flatnonzero(np.diff(self.offsets) != 1) + 1
+        return [
+            (int(o[0]), a.tobytes(), b.tobytes())
+            for o, a, b in zip(
+                np.split(self.offsets, splits),
+                np.split(self.orig, splits),
+                np.split(self.patch, splits)
+            )
+        ]
+
+    def __repr__(self) -> str:
+        return "{}(<{} changes>)".format(self.__class__.__name__, len(self))
+
 
 class Patch:
     """A patch for a file"""
 
-    def __init__(self, title: str, filename: str, changes: Sequence[Change]):
+    __slots__ = ("title", "filename", "changes", "_runs")
+
+    def __init__(self, title: str, filename: str, changes: Union[ChangeSet, Sequence[Change]]):
         self.title = title
         self.filename = filename
+        if not isinstance(changes, ChangeSet):
+            changes = ChangeSet.from_changes(changes)
         self.changes = changes
+        self._runs = changes.runs()
 
     def __iter__(self) -> Iterator[Change]:
         return iter(self.changes)
 
+    def status(self, fp) -> Tuple[bool, bool]:
+        """Get (valid, applied) for the file in a single pass"""
+        cs = self.changes
+        buf = _file_as_array(fp)
+        if len(cs) and cs.offsets[-1] >= len(buf):
+            return False, False
+        # Gather all the target bytes with a single fancy-index
+        cur = buf[cs.offsets]
+        applied = cur == cs.patch
+        return bool((applied | (cur == cs.orig)).all()), bool(applied.all())
+
     def valid(self, fp) -> bool:
         """Checks if the patch is valid for the file"""
-        return all(c.valid(fp) for c in self)
+        return self.status(fp)[0]
 
     def applied(self, fp) -> bool:
         """Checks if the patch has been applied to the file"""
-        return all(c.applied(fp) for c in self)
+        return self.status(fp)[1]
 
     def apply(self, fp, unpatch=False) -> bool:
         """Applies the patch to the file"""
         applied = True
-        for c in self:
-            applied &= c.apply(fp, unpatch=unpatch)
+        for offset, orig, patch in self._runs:
+            data = orig if unpatch else patch
+            applied &= _write_at(fp, offset, data) == len(data)
         return applied
 
     @classmethod
@@ -100,12 +198,12 @@ class Patch:
         try:
             title = next(lines_stripped)
             filename = next(lines_stripped)
-            changes = [Change.parse(line) for line in lines_stripped]
+            change_lines = list(lines_stripped)
 
-            if not changes:
+            if not change_lines:
                 raise ValueError("No changes specified")
 
-            return cls(title, filename, changes)
+            return cls(title, filename, _parse_changes(change_lines))
 
         except (StopIteration, ValueError) as e:
             raise InvalidFormat(
@@ -122,17 +220,26 @@ class Patch:
 
     def serialize(self) -> str:
         """Serialize the patch for inclusion in a crk file"""
-        return "{}\n{}\n{}\n{}".format(
+        parts = [
             "\n;".join(self.title.splitlines()),
             self.filename,
             ";" + "-" * (len(self.title) - 1),
-            "\n".join(x.serialize() for x in self.changes)
+        ]
+        # Emit the change lines straight from the arrays (tolist converts
+        # to native ints in bulk) instead of going through Change objects
+        cs = self.changes
+        parts.extend(
+            f"{o:08X}: {a:02X} {b:02X}"
+            for o, a, b in zip(cs.offsets.tolist(), cs.orig.tolist(), cs.patch.tolist())
         )
+        return "\n".join(parts)
 
 
 class Crk:
     """Bundles up multiple patches"""
 
+    __slots__ = ("title", "patches")
+
     def __init__(self, title: str, patches: Sequence[Patch]):
         self.title = title
         self.patches = patches
@@ -168,9 +275,7 @@ class Crk:
         try:
             title = "\n".join(_strip_comments(next(sections)))
         except StopIteration as e:
-            raise InvalidFormat(
-                "Invalid Crk:\n```\n{}\n```".format("\n".join(lines))
-            ) from e
+            raise InvalidFormat("Invalid Crk: no sections found") from e
 
         patches = []
         for section in sections:
@@ -184,7 +289,9 @@ class Crk:
 
     @classmethod
     def from_file(cls, file) -> "Crk":
-        return cls.from_lines(file.readlines())
+        # Iterating the file yields lines without buffering the whole
+        # thing in memory (only the current section is held at once)
+        return cls.from_lines(file)
 
     @classmethod
     def from_path(cls, path) -> "Crk":
@@ -200,10 +307,90 @@ class Crk:
 
     def serialize(self) -> str:
         """Serialize to a crk file"""
-        return "{}\n\n{}".format(
-            "\n;".join(self.title.splitlines()),
-            "\n\n".join(x.serialize() for x in self.patches)
+        parts = ["\n;".join(self.title.splitlines())]
+        for patch in self.patches:
+            parts.append("")
+            parts.append(patch.serialize())
+        return "\n".join(parts)
+
+
+def _parse_changes(lines: Sequence[str]) -> ChangeSet:
+    """Parse change lines into a ChangeSet in bulk"""
+    triples = CHANGE_RE.findall("\n".join(lines))
+    if len(triples) != len(lines):
+        # Re-parse line-by-line to raise on the offending line
+        for line in lines:
+            Change.parse(line)
+        # Never build a set with fewer changes than lines
+        raise InvalidFormat("Failed to parse all changes")
+
+    try:
+        offsets = np.fromiter(
+            (int(o, 16) for o, _, _ in triples), dtype=np.int64, count=len(triples)
         )
+    except OverflowError as e:
+        raise InvalidFormat("Change offset is too large") from e
+
+    return ChangeSet(
+        offsets=offsets,
+        orig=np.frombuffer(bytes.fromhex("".join(o for _, o, _ in triples)), dtype=np.uint8),
+        patch=np.frombuffer(bytes.fromhex("".join(p for _, _, p in triples)), dtype=np.uint8)
+    )
+
+
+def _read_at(fp, offset: int, size: int) -> bytes:
+    """Read from a file at an offset without moving its position
+
+    Uses a single pread syscall instead of a seek+read pair when the file
+    has a descriptor (and the platform supports it).
+    """
+    if isinstance(fp, mmap.mmap):
+        return fp[offset:offset + size]
+    try:
+        fp.flush()
+        return os.pread(fp.fileno(), size, offset)
+    except (AttributeError, OSError, ValueError):
+        fp.seek(offset)
+        return fp.read(size)
+
+
+def _write_at(fp, offset: int, data: bytes) -> int:
+    """Write to a file at an offset without moving its position
+
+    Uses a single pwrite syscall instead of a seek+write pair when the
+    file has a descriptor (and the platform supports it).
+    """
+    if isinstance(fp, mmap.mmap):
+        fp[offset:offset + len(data)] = data
+        return len(data)
+    try:
+        fp.flush()
+        return os.pwrite(fp.fileno(), data, offset)
+    except (AttributeError, OSError, ValueError):
+        fp.seek(offset)
+        return fp.write(data)
+
+
+def _file_as_array(fp) -> np.ndarray:
+    """Get the contents of an open file as a read-only array of bytes
+
+    Maps the file when possible (zero-copy). If it can't be mapped
+    (empty/special files or file-like objects with no file descriptor)
+    the entire file is read into memory in a single call - still far
+    cheaper than a seek+read per change.
+    """
+    if isinstance(fp, mmap.mmap):
+        # Already a buffer - view it directly instead of re-mapping
+        return np.frombuffer(fp, dtype=np.uint8)
+    try:
+        # Push any buffered writes to the OS so the map sees them
+        fp.flush()
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        fp.seek(0)
+        return np.frombuffer(fp.read(), dtype=np.uint8)
+    # The array holds a reference to the map, keeping it alive
+    return np.frombuffer(mm, dtype=np.uint8)
 
 
 def _strip_comments(lines: Iterable[str]) -> Generator[str, None, None]:
@@ -220,36 +407,110 @@ def _walk_files(directory: os.PathLike):
             yield os.path.relpath(os.path.join(root, f), start=directory)
 
 
-def _find_changes(original: os.PathLike, patched: os.PathLike) -> List[Change]:
-    """Get a list of Change objects based on two files"""
+def _find_changes_chunked(fp1, fp2) -> ChangeSet:
+    """Find changes between two open files by reading them in chunks
 
-    changes = []
-    with open(original, "rb") as fp1, open(patched, "rb") as fp2:
-        offset = 0
+    The files are assumed to be the same size (the caller checks this
+    before reading anything).
+    """
 
-        while True:
-            d1 = fp1.read(READ_BUFFER)
-            d2 = fp2.read(READ_BUFFER)
+    offsets, orig, patch = [], [], []
+    offset = 0
 
-            if len(d1) != len(d2):
-                raise ValueError("Files are not the same size - can't diff them")
+    while True:
+        d1 = fp1.read(READ_BUFFER)
+        d2 = fp2.read(READ_BUFFER)
 
-            if not d1:
-                break
+        if not (d1 or d2):
+            break
+
+        # Identical chunks (the common case) are a single memcmp
+        if d1 != d2:
+            # Compare the chunks as arrays so only the differing bytes are
+            # processed further
+            a = np.frombuffer(d1, dtype=np.uint8)
+            b = np.frombuffer(d2, dtype=np.uint8)
+            idx = np.flatnonzero(a != b)
+            offsets.append(idx + offset)
+            orig.append(a[idx])
+            patch.append(b[idx])
+
+        offset += len(d1)
+
+    if not offsets:
+        return ChangeSet([], [], [])
+    return ChangeSet(
+        offsets=np.concatenate(offsets),
+        orig=np.concatenate(orig),
+        patch=np.concatenate(patch)
+    )
 
-            for i, (b1, b2) in enumerate(zip(d1, d2)):
-                if b1 != b2:
-                    changes.append(Change(
-                        offset=offset + i,
-                        orig=bytes([b1]),
-                        patch=bytes([b2])
-                    ))
 
-            offset += len(d1)
+def _find_changes(original: os.PathLike, patched: os.PathLike) -> ChangeSet:
+    """Get a ChangeSet based on the differences between two files"""
+
+    if (s1 := os.path.getsize(original)) != (s2 := os.path.getsize(patched)):
+        raise ValueError(
+            f"Files are not the same size ({s1} vs {s2} bytes) - can't diff them"
+        )
+
+    with open(original, "rb") as fp1, open(patched, "rb") as fp2:
+        try:
+            mm1 = mmap.mmap(fp1.fileno(), 0, access=mmap.ACCESS_READ)
+            mm2 = mmap.mmap(fp2.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # mmap can fail for empty or special files
+            return _find_changes_chunked(fp1, fp2)
+
+        # Map both files into memory and compare them in a single pass
+        with mm1, mm2:
+            a = np.frombuffer(mm1, dtype=np.uint8)
+            b = np.frombuffer(mm2, dtype=np.uint8)
+            idx = np.flatnonzero(a != b)
+            changes = ChangeSet(offsets=idx, orig=a[idx], patch=b[idx])
+            # Release the buffers so the maps can be closed
+            del a, b
 
     return changes
 
 
+def _find_changes_multi(
+    original_dir: os.PathLike, patched_dir: os.PathLike, paths: Sequence[str]
+) -> Generator[Tuple[str, ChangeSet], None, None]:
+    """Yield (path, ChangeSet) pairs for each file common to both directories
+
+    File pairs are diffed in parallel across processes (each diff is
+    independent and CPU/IO bound). Paths that fail to diff are skipped
+    with a warning. Small jobs are done serially to avoid the pool
+    startup overhead.
+    """
+    if len(paths) < 4:
+        for path in paths:
+            try:
+                yield path, _find_changes(
+                    os.path.join(original_dir, path),
+                    os.path.join(patched_dir, path)
+                )
+            except ValueError as e:
+                __log__.warning("Skipping %s: %s", path, e)
+        return
+
+    with ProcessPoolExecutor() as executor:
+        futures = [
+            (path, executor.submit(
+                _find_changes,
+                os.path.join(original_dir, path),
+                os.path.join(patched_dir, path)
+            ))
+            for path in paths
+        ]
+        for path, future in futures:
+            try:
+                yield path, future.result()
+            except ValueError as e:
+                __log__.warning("Skipping %s: %s", path, e)
+
+
 def make_file_crk(original: os.PathLike, patched: os.PathLike) -> Crk:
     """Generate a Crk object from the differences between two files"""
     if not all(os.path.isfile(x) for x in (original, patched)):
@@ -285,32 +546,26 @@ def make_dir_crk(original_dir: os.PathLike, patched_dir: os.PathLike) -> Crk:
             diff
         )
 
-    num_files = 0
+    paths = sorted(original & patched)
+
     patches = []
-    for path in original & patched:
-        num_files += 1
-        try:
-            if not (changes := _find_changes(
-                os.path.join(original_dir, path),
-                os.path.join(patched_dir, path)
-            )):
-                continue
-
-            name = os.path.basename(path)
-            patches.append(
-                Patch(
-                    title=f"Patch {len(changes)} bytes in {name}",
-                    filename=path,
-                    changes=changes
-                )
+    for path, changes in _find_changes_multi(original_dir, patched_dir, paths):
+        if not changes:
+            continue
+
+        name = os.path.basename(path)
+        patches.append(
+            Patch(
+                title=f"Patch {len(changes)} bytes in {name}",
+                filename=path,
+                changes=changes
             )
-        except ValueError as e:
-            __log__.warning("Skipping %s: %s", path, e)
+        )
 
-    if not num_files:
+    if not paths:
         raise ValueError("No files to compare discovered")
     if not patches:
-        raise ValueError(f"All {num_files} files are the same")
+        raise ValueError(f"All {len(paths)} files are the same")
 
     head, dirname = os.path.split(original_dir)
     if not dirname:
@@ -2,6 +2,7 @@
 
 import argparse
 import logging
+import mmap
 import os
 import sys
 from typing import Optional
@@ -110,18 +111,32 @@ def apply_crk():
             msg("NO FILE", patch)
             continue
         with open(path, "r+b") as f:
-            if not patch.valid(f):
-                msg("INVALID", patch)
-            elif (patched := patch.applied(f)) == args.apply or args.apply is None:
-                msg(actions[patched], patch)
-            elif (
-                not args.ask
-                or input(f"{questions[args.apply]} '{patch.title}'? [y/N]: ").lower() == "y"
-            ):
-                patch.apply(f, unpatch=not args.apply)
-                msg(actions[args.apply], patch)
-            else:
-                msg("SKIPPED", patch)
+            # Map the file once so checking and applying all share a
+            # single buffer instead of doing per-access syscalls
+            try:
+                mm = mmap.mmap(f.fileno(), 0)
+            except (OSError, ValueError):
+                mm = None  # empty/special file - fall back to the file object
+            fp = mm if mm is not None else f
+
+            try:
+                valid, patched = patch.status(fp)
+                if not valid:
+                    msg("INVALID", patch)
+                elif patched == args.apply or args.apply is None:
+                    msg(actions[patched], patch)
+                elif (
+                    not args.ask
+                    or input(f"{questions[args.apply]} '{patch.title}'? [y/N]: ").lower() == "y"
+                ):
+                    patch.apply(fp, unpatch=not args.apply)
+                    msg(actions[args.apply], patch)
+                else:
+                    msg("SKIPPED", patch)
+            finally:
+                if mm is not None:
+                    mm.flush()
+                    mm.close()
 
 
 if __name__ == "__main__":
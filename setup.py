@@ -32,6 +32,7 @@ setup(
         "License :: OSI Approved :: Mozilla Public License 2.0 (MPL 2.0)",
     ],
     packages=["pycrk"],
+    install_requires=["numpy"],
     entry_points={"console_scripts": [
         "crk-apply=pycrk.__main__:apply_crk",
         "crk-generate=pycrk.__main__:generate_crk",